@@ -14,26 +14,76 @@ Runtime behavior of the generated EXE:
 No external dependencies are required beyond stock Windows 10 (uses the built-in
 `csc.exe` compiler from the .NET Framework). A working Prefix installation is
 still required for the bundled runtime and libraries you provide.
+
+If the optional `deflate` package (libdeflate bindings) is installed, it is used
+to compress the payload; otherwise the standard library's zlib is used. If
+Pillow is installed, non-ICO icons are converted in-process instead of with the
+bundled GDI+ converter.
 """
 
 from __future__ import annotations
 
 import argparse
+import collections
+import contextlib
+import functools
+import mmap
+import multiprocessing
 import os
 import shutil
 import struct
 import subprocess
 import sys
 import tempfile
+import time
 import zipfile
+import zlib
 import hashlib
-from pathlib import Path
+import io
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path, PurePath
+from typing import BinaryIO, Iterator
+
+try:
+	import deflate as libdeflate
+except ImportError:
+	libdeflate = None
+
+try:
+	from PIL import Image
+except ImportError:
+	Image = None
 
 
 MARKER = b"PREFIXSFX1"
 # footer layout: payload length (int64 LE) + SHA256 (32 bytes) + marker
 FOOTER_LEN = len(MARKER) + 8 + 32
 MANIFEST_NAME = "__main_path.txt"
+# zipfile's default DEFLATE level
+COMPRESSION_LEVEL = 6
+# Small files are grouped into batches of roughly this many bytes so each one
+# does not pay for its own round trip to a worker process.
+COMPRESS_BATCH_BYTES = 4 * 1024 * 1024
+# Files at least this large are streamed into the zip by the main process
+# rather than compressed in memory by a worker.
+STREAM_FILE_BYTES = 32 * 1024 * 1024
+# ProcessPoolExecutor rejects more workers than this on Windows.
+MAX_WINDOWS_WORKERS = 61
+COPY_CHUNK_SIZE = 1024 * 1024
+# Files that are already compressed are stored rather than deflated again.
+STORED_SUFFIXES = frozenset({".png", ".jpg", ".jpeg", ".gif", ".ico", ".zip", ".gz", ".xz", ".zst", ".7z", ".woff2"})
+# Anything else is stored when its first few KiB barely shrink at level 1.
+ENTROPY_PROBE_BYTES = 4096
+ENTROPY_PROBE_RATIO = 0.95
+ZIP_WRITE_BUFFER = 1024 * 1024
+# ZIP header constants, matching what zipfile writes.
+ZIP64_LIMIT = (1 << 31) - 1
+DEFAULT_VERSION = 20
+ZIP64_VERSION = 45
+ZIP_FLAG_UTF8 = 0x800
+ZIP_CREATE_SYSTEM = 0 if sys.platform == "win32" else 3
+# Icon frame sizes, matching gen_ico.cs.
+ICO_SIZES = (256, 128, 64, 48, 32, 16)
 
 
 class BuildError(Exception):
@@ -88,10 +138,31 @@ def parse_args(argv: list[str]) -> argparse.Namespace:
 		help="Enable verbose logging",
 	)
 
+	parser.add_argument(
+		"--compression-level",
+		type=int,
+		choices=range(0, 13),
+		default=COMPRESSION_LEVEL,
+		metavar="N",
+		help="DEFLATE level for the payload: 0 stores files uncompressed, 1-9 as in zlib, 10-12 need the 'deflate' package (files of 32 MiB or more are streamed through zlib at 9 at most)",
+	)
+
+	parser.add_argument(
+		"--no-stub-cache",
+		action="store_true",
+		help="Always recompile the C# stub and image converter instead of reusing cached builds",
+	)
+
+	parser.add_argument(
+		"--in-process-csc",
+		action="store_true",
+		help="Compile the C# stub with Roslyn hosted through pythonnet, falling back to csc.exe if unavailable",
+	)
+
 	parser.add_argument(
 		"--icon",
 		default=None,
-		help="Path to an ICO or image file to use as the generated EXE icon; non-ICO images will be converted using GDI+.",
+		help="Path to an ICO or image file to use as the generated EXE icon; non-ICO images are converted with Pillow if installed, otherwise with the GDI+ converter.",
 	)
 
 	return parser.parse_args(argv)
@@ -107,114 +178,601 @@ def ensure_windows() -> None:
 		raise BuildError("This builder only supports Windows 10+.")
 
 
-def parse_mapping(raw: str) -> tuple[Path, str]:
+def resolve_existing(raw_path: str, resolved: dict[str, Path]) -> Path:
+	# strict=True fails for missing paths, so this doubles as the existence check.
+	# *resolved* memoizes within one build; cwd and the filesystem may differ across builds.
+	if raw_path not in resolved:
+		resolved[raw_path] = Path(raw_path).expanduser().resolve(strict=True)
+	return resolved[raw_path]
+
+
+def parse_mapping(raw: str, resolved: dict[str, Path]) -> tuple[Path, str]:
 	if ";" not in raw:
 		raise BuildError(f"Mapping must be of form 'source;dest_in_exe': {raw!r}")
 	src_raw, dest_raw = raw.split(";", 1)
-	src = Path(src_raw).expanduser().resolve()
-	if not src.exists():
-		raise BuildError(f"Included path does not exist: {src}")
+	try:
+		src = resolve_existing(src_raw, resolved)
+	except FileNotFoundError:
+		raise BuildError(f"Included path does not exist: {Path(src_raw).expanduser().absolute()}") from None
+	except OSError as exc:
+		raise BuildError(f"Cannot access included path {Path(src_raw).expanduser().absolute()}: {exc}") from None
 	dest = dest_raw.strip() or "."
 	return src, dest
 
 
-def copy_main(main_path: Path, dest_rel: str, payload_root: Path) -> str:
+def archive_name(dest_rel: str, rel: str | PurePath) -> str:
+	"""Return the bundle path for *rel* placed under *dest_rel* ('.' = root)."""
+	return PurePath(dest_rel, rel).as_posix()
+
+
+def walk_files(root: str | Path, prefix: str = "") -> Iterator[tuple[str, str]]:
+	"""Yield (path, prefix + relative POSIX name) for every file below *root*, following symlinks."""
+	subdirs: list[tuple[str, str]] = []
+	with os.scandir(root) as it:
+		for entry in it:
+			if entry.is_dir():
+				subdirs.append((entry.path, f"{prefix}{entry.name}/"))
+			elif entry.is_file():
+				yield entry.path, prefix + entry.name
+	for path, sub_prefix in subdirs:
+		yield from walk_files(path, sub_prefix)
+
+
+def add_entry(entries: dict[str, tuple[str, str | Path]], name: str, src: str | Path) -> None:
+	# Windows paths are case-insensitive: names differing only in case are one
+	# file, keeping the first spelling as NTFS did. Two spellings would make
+	# ExtractToDirectory in the bootloader fail.
+	key = os.path.normcase(name)
+	entries[key] = (entries[key][0] if key in entries else name, src)
+
+
+def add_tree(src_dir: str | Path, dest_rel: str, entries: dict[str, tuple[str, str | Path]]) -> None:
+	base = archive_name(dest_rel, "")
+	for path, name in walk_files(src_dir, "" if base == "." else base + "/"):
+		add_entry(entries, name, path)
+
+
+def add_main(main_path: Path, dest_rel: str, entries: dict[str, tuple[str, str | Path]]) -> str:
 	dest_rel = dest_rel.strip() or "."
-	target_dir = payload_root if dest_rel == "." else payload_root / dest_rel
-	target_dir.mkdir(parents=True, exist_ok=True)
-	target_path = target_dir / main_path.name
-	shutil.copy2(main_path, target_path)
-	return str(target_path.relative_to(payload_root))
+	add_entry(entries, archive_name(dest_rel, main_path.name), main_path)
+	return str(PurePath(dest_rel, main_path.name))
 
 
-def copy_includes(
-	includes: list[str], payload_root: Path, *, verbose: bool
+def add_includes(
+	includes: list[str], entries: dict[str, tuple[str, str | Path]], resolved: dict[str, Path], *, verbose: bool
 ) -> None:
 	for entry in includes:
-		src, dest_rel = parse_mapping(entry)
+		src, dest_rel = parse_mapping(entry, resolved)
 		if not src.is_file():
 			raise BuildError(f"Included file is not a file: {src}")
-		target_dir = payload_root if dest_rel == "." else payload_root / dest_rel
-		target_dir.mkdir(parents=True, exist_ok=True)
-		target_path = target_dir / src.name
-		log(f"Including file {src} -> {target_path.relative_to(payload_root)}", verbose=verbose)
-		shutil.copy2(src, target_path)
+		target = archive_name(dest_rel, src.name)
+		log(f"Including file {src} -> {target}", verbose=verbose)
+		add_entry(entries, target, src)
 
 
-def copy_include_folders(
-	folders: list[str], payload_root: Path, *, verbose: bool
+def add_include_folders(
+	folders: list[str], entries: dict[str, tuple[str, str | Path]], resolved: dict[str, Path], *, verbose: bool
 ) -> None:
 	for entry in folders:
-		src, dest_rel = parse_mapping(entry)
+		src, dest_rel = parse_mapping(entry, resolved)
 		if not src.is_dir():
 			raise BuildError(f"Included folder is not a directory: {src}")
 		if dest_rel == ".":
-			target_dir = payload_root / src.name
-		else:
-			target_dir = payload_root / dest_rel
-		log(f"Including folder {src} -> {target_dir.relative_to(payload_root)}", verbose=verbose)
-		shutil.copytree(src, target_dir, dirs_exist_ok=True)
+			dest_rel = src.name
+		log(f"Including folder {src} -> {dest_rel}", verbose=verbose)
+		add_tree(src, dest_rel, entries)
 
 
-def copy_pre_runtime(pre_exe: Path, payload_root: Path, *, verbose: bool, exclude: set[Path] | None = None) -> None:
+def add_pre_runtime(pre_exe: Path, entries: dict[str, tuple[str, str | Path]], *, verbose: bool, exclude: set[Path] | None = None) -> None:
 	if not pre_exe.exists() or not pre_exe.is_file():
 		raise BuildError(f"prefix.exe not found: {pre_exe}")
 	runtime_dir = pre_exe.parent
 	exclude = exclude or set()
 
-	# Copy all files and folders from the runtime directory into the payload root.
+	# Add all files and folders from the runtime directory at the payload root.
 	# This ensures the entire runtime directory (exe, lib/, ext/, etc.) is embedded.
-	for entry in sorted(runtime_dir.iterdir()):
+	with os.scandir(runtime_dir) as it:
+		runtime_entries = sorted(it, key=lambda e: e.name)
+	for entry in runtime_entries:
 		# Skip Git metadata and ignore files that shouldn't be bundled.
 		if entry.name in (".git", ".gitignore"):
 			log(f"Skipping {entry.name}", verbose=verbose)
 			continue
 		
 		# Skip excluded files (e.g. the output executable itself)
-		if entry.resolve() in exclude:
+		if Path(entry.path).resolve() in exclude:
 			log(f"Skipping excluded file {entry.name}", verbose=verbose)
 			continue
 
-		target = payload_root / entry.name
 		if entry.is_dir():
-			shutil.copytree(entry, target, dirs_exist_ok=True)
-			log(f"Copied runtime directory {entry.name}/ -> {target.relative_to(payload_root)}", verbose=verbose)
+			add_tree(entry.path, entry.name, entries)
+			log(f"Added runtime directory {entry.name}/", verbose=verbose)
 		else:
-			shutil.copy2(entry, target)
-			log(f"Copied runtime file {entry.name} -> {target.relative_to(payload_root)}", verbose=verbose)
+			add_entry(entries, entry.name, entry.path)
+			log(f"Added runtime file {entry.name}", verbose=verbose)
 
 
-def write_manifest(payload_root: Path, main_rel_path: str) -> None:
-	manifest_path = payload_root / MANIFEST_NAME
-	manifest_path.write_text(main_rel_path + "\n", encoding="ascii")
+class PayloadZipWriter:
+	"""Minimal streaming ZIP writer; Zip64 records are added only when needed."""
 
+	def __init__(self, path: Path) -> None:
+		self.fp = path.open("wb", buffering=ZIP_WRITE_BUFFER)
+		self.offset = 0
+		self.count = 0
+		self.central_dir = bytearray()
 
-def build_payload_zip(payload_root: Path, zip_path: Path) -> None:
-	with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
-		for fs_path in payload_root.rglob("*"):
-			if fs_path.is_dir():
-				continue
-			arcname = fs_path.relative_to(payload_root)
-			zf.write(fs_path, arcname)
+	def __enter__(self) -> PayloadZipWriter:
+		return self
+
+	def __exit__(self, exc_type, exc, tb) -> None:
+		if exc_type is None:
+			self.close()
+		else:
+			self.fp.close()
+
+	def write(self, data: bytes) -> None:
+		self.fp.write(data)
+		self.offset += len(data)
+
+	def add(
+		self,
+		arcname: str,
+		crc: int,
+		body: bytes,
+		size: int,
+		compress_type: int,
+		*,
+		mtime: float,
+		mode: int,
+	) -> None:
+		filename, flags = encode_arcname(arcname)
+		dostime, dosdate = dos_timestamp(mtime)
+		header_offset = self.offset
+		compress_size = len(body)
+		zip64 = size > ZIP64_LIMIT or compress_size > ZIP64_LIMIT
+		self.write(local_header(filename, flags, compress_type, dostime, dosdate, crc, size, compress_size, zip64=zip64))
+		self.write(body)
+		self.record_central(
+			filename, flags, compress_type, dostime, dosdate, crc, size, compress_size, header_offset, mode, zip64=zip64
+		)
+
+	def add_file(self, src: str | Path, arcname: str, size: int, level: int, *, mtime: float, mode: int) -> int:
+		"""Stream *src* into the archive; returns the compress_type used."""
+		# The local header gets a placeholder CRC and sizes, patched once the data is out.
+		filename, flags = encode_arcname(arcname)
+		dostime, dosdate = dos_timestamp(mtime)
+		header_offset = self.offset
+		with open(src, "rb") as f:
+			chunk = f.read(COPY_CHUNK_SIZE)
+			if level == 0 or is_incompressible(arcname, chunk):
+				compress_type = zipfile.ZIP_STORED
+				compressor = None
+				bound = size
+			else:
+				compress_type = zipfile.ZIP_DEFLATED
+				compressor = zlib.compressobj(min(level, zlib.Z_BEST_COMPRESSION), zlib.DEFLATED, -zlib.MAX_WBITS)
+				# zlib's compressBound: the most DEFLATE can expand the data.
+				bound = size + (size >> 12) + (size >> 14) + (size >> 25) + 13
+			zip64 = size > ZIP64_LIMIT or bound > ZIP64_LIMIT
+			self.write(local_header(filename, flags, compress_type, dostime, dosdate, 0, size, 0, zip64=zip64))
+			data_start = self.offset
+			crc = 0
+			read = 0
+			while chunk:
+				crc = zlib.crc32(chunk, crc)
+				read += len(chunk)
+				self.write(chunk if compressor is None else compressor.compress(chunk))
+				chunk = f.read(COPY_CHUNK_SIZE)
+			if compressor is not None:
+				self.write(compressor.flush())
+		if read != size:
+			raise BuildError(f"File changed size while being bundled: {src}")
+		compress_size = self.offset - data_start
+		self.fp.seek(header_offset)
+		self.fp.write(local_header(filename, flags, compress_type, dostime, dosdate, crc, size, compress_size, zip64=zip64))
+		self.fp.seek(self.offset)
+		self.record_central(
+			filename, flags, compress_type, dostime, dosdate, crc, size, compress_size, header_offset, mode, zip64=zip64
+		)
+		return compress_type
+
+	def record_central(
+		self,
+		filename: bytes,
+		flags: int,
+		compress_type: int,
+		dostime: int,
+		dosdate: int,
+		crc: int,
+		size: int,
+		compress_size: int,
+		header_offset: int,
+		mode: int,
+		*,
+		zip64: bool,
+	) -> None:
+		# The central directory carries only the zip64 fields that overflow, in spec order.
+		zip64_fields: list[int] = []
+		central_size = size
+		central_compress_size = compress_size
+		central_offset = header_offset
+		if size > ZIP64_LIMIT:
+			zip64_fields.append(size)
+			central_size = 0xFFFFFFFF
+		if compress_size > ZIP64_LIMIT:
+			zip64_fields.append(compress_size)
+			central_compress_size = 0xFFFFFFFF
+		if header_offset > ZIP64_LIMIT:
+			zip64_fields.append(header_offset)
+			central_offset = 0xFFFFFFFF
+		if zip64_fields:
+			extra = struct.pack(f"<HH{len(zip64_fields)}Q", 0x0001, 8 * len(zip64_fields), *zip64_fields)
+		else:
+			extra = b""
+		version = ZIP64_VERSION if zip64 or zip64_fields else DEFAULT_VERSION
+		self.central_dir += struct.pack(
+			"<4s4B4HL2L5H2L", b"PK\x01\x02", version, ZIP_CREATE_SYSTEM, version, 0,
+			flags, compress_type, dostime, dosdate, crc, central_compress_size, central_size,
+			len(filename), len(extra), 0, 0, 0, (mode & 0xFFFF) << 16, central_offset,
+		)
+		self.central_dir += filename
+		self.central_dir += extra
+		self.count += 1
+
+	def close(self) -> None:
+		start = self.offset
+		self.write(self.central_dir)
+		size = len(self.central_dir)
+		count = self.count
+		if count >= 0xFFFF or start > ZIP64_LIMIT or size > ZIP64_LIMIT:
+			zip64_end = self.offset
+			self.write(struct.pack(
+				"<4sQ2H2L4Q", b"PK\x06\x06", 44, ZIP64_VERSION, ZIP64_VERSION, 0, 0, count, count, size, start,
+			))
+			self.write(struct.pack("<4sLQL", b"PK\x06\x07", 0, zip64_end, 1))
+			count = min(count, 0xFFFF)
+			size = min(size, 0xFFFFFFFF)
+			start = min(start, 0xFFFFFFFF)
+		self.write(struct.pack("<4s4H2LH", b"PK\x05\x06", 0, 0, count, count, size, start, 0))
+		self.fp.close()
+
+
+def encode_arcname(arcname: str) -> tuple[bytes, int]:
+	"""Return the encoded name and general-purpose flags for a ZIP entry."""
+	try:
+		return arcname.encode("ascii"), 0
+	except UnicodeEncodeError:
+		return arcname.encode("utf-8"), ZIP_FLAG_UTF8
+
+
+def local_header(
+	filename: bytes,
+	flags: int,
+	compress_type: int,
+	dostime: int,
+	dosdate: int,
+	crc: int,
+	size: int,
+	compress_size: int,
+	*,
+	zip64: bool,
+) -> bytes:
+	if zip64:
+		extra = struct.pack("<HHQQ", 0x0001, 16, size, compress_size)
+		header_sizes = (0xFFFFFFFF, 0xFFFFFFFF)
+		version = ZIP64_VERSION
+	else:
+		extra = b""
+		header_sizes = (compress_size, size)
+		version = DEFAULT_VERSION
+	return struct.pack(
+		"<4s2B4HL2L2H", b"PK\x03\x04", version, 0, flags, compress_type,
+		dostime, dosdate, crc, *header_sizes, len(filename), len(extra),
+	) + filename + extra
+
+
+def dos_timestamp(timestamp: float) -> tuple[int, int]:
+	"""Return the (time, date) words of a ZIP header, clamped to the DOS date range."""
+	t = time.localtime(timestamp)
+	if t.tm_year < 1980:
+		return 0, (1 << 5) | 1
+	if t.tm_year > 2107:
+		return (23 << 11) | (59 << 5) | 29, (127 << 9) | (12 << 5) | 31
+	return (
+		(t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2),
+		((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday,
+	)
 
 
+def deflate_raw(data: bytes, level: int = COMPRESSION_LEVEL) -> bytes:
+	"""Compress *data* to a raw DEFLATE stream, preferring libdeflate when available."""
+	if libdeflate is not None:
+		return bytes(libdeflate.deflate_compress(data, level))
+	# Levels above 9 only exist in libdeflate.
+	compressor = zlib.compressobj(min(level, zlib.Z_BEST_COMPRESSION), zlib.DEFLATED, -zlib.MAX_WBITS)
+	return compressor.compress(data) + compressor.flush()
+
+
+def is_incompressible(name: str, data: bytes) -> bool:
+	"""Guess whether DEFLATE would be wasted on *data*, from its extension or a quick probe."""
+	if PurePath(name).suffix.lower() in STORED_SUFFIXES:
+		return True
+	sample = data[:ENTROPY_PROBE_BYTES]
+	return len(zlib.compress(sample, 1)) > len(sample) * ENTROPY_PROBE_RATIO
+
+
+def compress_data(arcname: str, data: bytes, level: int) -> tuple[str, int, bytes, int, int]:
+	"""Return (arcname, crc32, body, size, compress_type) for *data*."""
+	crc = zlib.crc32(data)
+	if level == 0 or is_incompressible(arcname, data):
+		return arcname, crc, data, len(data), zipfile.ZIP_STORED
+	return arcname, crc, deflate_raw(data, level), len(data), zipfile.ZIP_DEFLATED
+
+
+def compress_file(src: str, arcname: str, level: int) -> tuple[str, int, bytes, int, int]:
+	"""compress_data for a file on disk, read once in chunks (whole with libdeflate)."""
+	if libdeflate is not None:
+		return compress_data(arcname, Path(src).read_bytes(), level)
+	with open(src, "rb") as f:
+		chunk = f.read(COPY_CHUNK_SIZE)
+		stored = level == 0 or is_incompressible(arcname, chunk)
+		compressor = None if stored else zlib.compressobj(
+			min(level, zlib.Z_BEST_COMPRESSION), zlib.DEFLATED, -zlib.MAX_WBITS
+		)
+		crc = 0
+		size = 0
+		parts: list[bytes] = []
+		while chunk:
+			crc = zlib.crc32(chunk, crc)
+			size += len(chunk)
+			parts.append(chunk if compressor is None else compressor.compress(chunk))
+			chunk = f.read(COPY_CHUNK_SIZE)
+	if compressor is None:
+		return arcname, crc, b"".join(parts), size, zipfile.ZIP_STORED
+	parts.append(compressor.flush())
+	return arcname, crc, b"".join(parts), size, zipfile.ZIP_DEFLATED
+
+
+def compress_batch(batch: list[tuple[str, str]], level: int) -> list[tuple[str, int, bytes, int, int]]:
+	"""Worker: run compress_file over each (path, arcname) pair."""
+	return [compress_file(src, arcname, level) for src, arcname in batch]
+
+
+def batch_entries(
+	entries: list[tuple[str | Path, str, os.stat_result]]
+) -> list[list[tuple[str | Path, str, os.stat_result]]]:
+	"""Group entries into batches of about COMPRESS_BATCH_BYTES; files to be streamed get their own."""
+	batches: list[list[tuple[str | Path, str, os.stat_result]]] = []
+	current: list[tuple[str | Path, str, os.stat_result]] = []
+	current_bytes = 0
+	for entry in entries:
+		if entry[2].st_size >= STREAM_FILE_BYTES:
+			if current:
+				batches.append(current)
+				current = []
+				current_bytes = 0
+			batches.append([entry])
+			continue
+		current.append(entry)
+		current_bytes += entry[2].st_size
+		if current_bytes >= COMPRESS_BATCH_BYTES:
+			batches.append(current)
+			current = []
+			current_bytes = 0
+	if current:
+		batches.append(current)
+	return batches
+
+
+def compress_in_order(
+	jobs: list[list[tuple[str, str]] | None], level: int, pool: ProcessPoolExecutor | None, window: int
+) -> Iterator[list[tuple[str, int, bytes, int, int]] | None]:
+	"""Yield compress_batch results in order, with at most *window* jobs outstanding."""
+	if pool is None:
+		for job in jobs:
+			yield None if job is None else compress_batch(job, level)
+		return
+	pending: collections.deque[Future | None] = collections.deque()
+	for job in jobs:
+		pending.append(None if job is None else pool.submit(compress_batch, job, level))
+		if len(pending) >= window:
+			future = pending.popleft()
+			yield None if future is None else future.result()
+	while pending:
+		future = pending.popleft()
+		yield None if future is None else future.result()
+
+
+def build_payload_zip(
+	entries: list[tuple[str | Path, str]],
+	zip_path: Path,
+	*,
+	extra_entries: list[tuple[str, bytes]] | None = None,
+	level: int = COMPRESSION_LEVEL,
+	verbose: bool = False,
+) -> None:
+	"""Zip each (source file, archive name) pair, then the generated *extra_entries*."""
+	stats = [(src, arcname, os.stat(src)) for src, arcname in entries]
+	extra_entries = extra_entries or []
+
+	# Compress in parallel, then assemble the archive serially in the original
+	# order. Very large files are streamed straight into the archive here
+	# instead, so no whole file is ever held in memory.
+	batches = batch_entries(stats)
+	jobs = [
+		None if batch[0][2].st_size >= STREAM_FILE_BYTES else [(str(src), arcname) for src, arcname, _ in batch]
+		for batch in batches
+	]
+	streamed = sum(job is None for job in jobs)
+	if streamed and level > zlib.Z_BEST_COMPRESSION and libdeflate is not None:
+		# libdeflate has no streaming API, so streamed files use zlib's best level.
+		log(
+			f"Compression level {level} is capped at {zlib.Z_BEST_COMPRESSION} for {streamed} file(s) of "
+			f"{STREAM_FILE_BYTES // (1024 * 1024)} MiB or more",
+			verbose=True,
+		)
+	stored = 0
+	workers = min(len(jobs) - streamed, os.cpu_count() or 1)
+	if sys.platform == "win32":
+		workers = min(workers, MAX_WINDOWS_WORKERS)
+	with contextlib.ExitStack() as stack:
+		pool = stack.enter_context(ProcessPoolExecutor(max_workers=workers)) if workers > 1 else None
+		results = compress_in_order(jobs, level, pool, window=2 * workers)
+		writer = stack.enter_context(PayloadZipWriter(zip_path))
+
+		for batch, batch_results in zip(batches, results):
+			if batch_results is None:
+				src, arcname, st = batch[0]
+				compress_type = writer.add_file(src, arcname, st.st_size, level, mtime=st.st_mtime, mode=st.st_mode)
+				if compress_type == zipfile.ZIP_STORED:
+					stored += 1
+				continue
+			for (_, _, st), (arcname, crc, body, size, compress_type) in zip(batch, batch_results):
+				writer.add(arcname, crc, body, size, compress_type, mtime=st.st_mtime, mode=st.st_mode)
+				if compress_type == zipfile.ZIP_STORED:
+					stored += 1
+
+		now = time.time()
+		for arcname, data in extra_entries:
+			arcname, crc, body, size, compress_type = compress_data(arcname, data, level)
+			# Same permissions ZipFile.writestr gives in-memory entries.
+			writer.add(arcname, crc, body, size, compress_type, mtime=now, mode=0o600)
+			if compress_type == zipfile.ZIP_STORED:
+				stored += 1
+	log(f"Stored {stored} of {len(stats) + len(extra_entries)} files without compression", verbose=verbose)
+
+
+@functools.lru_cache(maxsize=None)
 def find_csc() -> Path | None:
 	windir = Path(os.environ.get("WINDIR", "C:\\Windows"))
-	candidates: list[Path] = []
 	for framework_root in ["Framework64", "Framework"]:
 		base = windir / "Microsoft.NET" / framework_root
-		if not base.exists():
+		try:
+			with os.scandir(base) as it:
+				versions = [entry.name for entry in it if entry.name.startswith("v") and entry.is_dir()]
+		except OSError:
 			continue
 		# Prefer newer versions by sorting descending
-		for sub in sorted(base.iterdir(), reverse=True):
-			csc_path = sub / "csc.exe"
-			if csc_path.exists():
-				candidates.append(csc_path)
-	return candidates[0] if candidates else None
+		for version in sorted(versions, reverse=True):
+			csc_path = base / version / "csc.exe"
+			if csc_path.is_file():
+				return csc_path
+	return None
+
+
+def stub_cache_dir() -> Path:
+	base = os.environ.get("LOCALAPPDATA") or tempfile.gettempdir()
+	return Path(base) / "prefix-freezer" / "stub-cache"
 
 
+def store_in_stub_cache(built: Path, cached: Path, *, verbose: bool) -> None:
+	# Best-effort: copy next to the final name, then rename into place so a
+	# concurrent build never sees a partially written file.
+	try:
+		cached.parent.mkdir(parents=True, exist_ok=True)
+		partial = cached.with_name(f"{cached.stem}.{os.getpid()}.tmp")
+		shutil.copy2(built, partial)
+		os.replace(partial, cached)
+		log(f"Cached {built.name} at {cached}", verbose=verbose)
+	except OSError as exc:
+		log(f"Could not cache {built.name}: {exc}", verbose=verbose)
+
+
+@functools.lru_cache(maxsize=None)
+def load_roslyn():
+	"""Return (CodeAnalysis, CSharp, framework dir, version) on .NET Framework, else None."""
+	# Cached so that repeated builds in one process reuse the already-JITted compiler.
+	try:
+		import clr
+
+		clr.AddReference("Microsoft.CodeAnalysis")
+		clr.AddReference("Microsoft.CodeAnalysis.CSharp")
+		import Microsoft.CodeAnalysis as code_analysis
+		import Microsoft.CodeAnalysis.CSharp as csharp
+		from System import Object
+
+		framework_dir = Path(Object().GetType().Assembly.Location).parent
+		version = clr.GetClrType(csharp.CSharpCompilation).Assembly.GetName().Version.ToString()
+	except Exception:
+		# pythonnet not installed, no .NET runtime, or Roslyn assemblies not found.
+		return None
+	# e.g. C:\Windows\Microsoft.NET\Framework64\v4.0.30319; under coreclr this is
+	# the .NET Core shared folder instead.
+	if framework_dir.parent.name.lower() not in ("framework", "framework64"):
+		return None
+	return code_analysis, csharp, framework_dir, version
+
+
+def compile_stub_in_process(
+	source: bytes, stub_exe: Path, *, verbose: bool, win_icon: Path | None = None
+) -> bool:
+	"""Compile the stub with in-process Roslyn; False means fall back to csc.exe."""
+	roslyn = load_roslyn()
+	if roslyn is None:
+		log("In-process C# compiler unavailable; falling back to csc.exe", verbose=verbose)
+		return False
+	try:
+		emit_stub_in_process(roslyn, source, stub_exe, verbose=verbose, win_icon=win_icon)
+	except BuildError:
+		raise
+	except Exception as exc:
+		log(f"In-process C# compiler failed ({exc}); falling back to csc.exe", verbose=verbose)
+		return False
+	return True
+
+
+def emit_stub_in_process(roslyn, source: bytes, stub_exe: Path, *, verbose: bool, win_icon: Path | None) -> None:
+	code_analysis, csharp, framework_dir, _ = roslyn
+	from System.Collections.Generic import List
+	from System.IO import File, MemoryStream
+
+	# Reference the same framework assemblies csc.exe would pick up by default.
+	references = List[code_analysis.MetadataReference]()
+	for name in (
+		"mscorlib.dll",
+		"System.dll",
+		"System.Core.dll",
+		"System.IO.Compression.dll",
+		"System.IO.Compression.FileSystem.dll",
+	):
+		references.Add(code_analysis.MetadataReference.CreateFromFile(str(framework_dir / name)))
+	trees = List[code_analysis.SyntaxTree]()
+	trees.Add(csharp.CSharpSyntaxTree.ParseText(source.decode("utf-8")))
+	options = (
+		csharp.CSharpCompilationOptions(code_analysis.OutputKind.ConsoleApplication)
+		.WithOptimizationLevel(code_analysis.OptimizationLevel.Release)
+		.WithPlatform(code_analysis.Platform.AnyCpu)
+		.WithDeterministic(True)
+	)
+	compilation = csharp.CSharpCompilation.Create(stub_exe.stem, trees, references, options)
 
-def compile_stub(temp_dir: Path, *, verbose: bool, win_icon: Path | None = None) -> Path:
+	log("Compiling stub in-process with Roslyn", verbose=verbose)
+	icon_stream = File.OpenRead(str(win_icon)) if win_icon else None
+	try:
+		win32_resources = compilation.CreateDefaultWin32Resources(True, False, None, icon_stream)
+		pe_stream = MemoryStream()
+		result = compilation.Emit(pe_stream, None, None, win32_resources)
+	finally:
+		if icon_stream is not None:
+			icon_stream.Dispose()
+	if not result.Success:
+		errors = [
+			diag.ToString()
+			for diag in result.Diagnostics
+			if diag.Severity == code_analysis.DiagnosticSeverity.Error
+		]
+		raise BuildError("Roslyn failed to compile the stub:\n" + "\n".join(errors))
+	File.WriteAllBytes(str(stub_exe), pe_stream.ToArray())
+
+
+def compile_stub(
+	temp_dir: Path,
+	*,
+	verbose: bool,
+	win_icon: Path | None = None,
+	use_cache: bool = True,
+	in_process: bool = False,
+) -> Path:
 	# Backwards-compatible wrapper that optionally compiles the stub with an icon.
 	csc_path = find_csc()
 	if not csc_path:
@@ -225,75 +783,196 @@ def compile_stub(temp_dir: Path, *, verbose: bool, win_icon: Path | None = None)
 	stub_source_path = Path(__file__).parent / "bootloader.cs"
 	if not stub_source_path.exists():
 		raise BuildError(f"Embedded C# stub file not found: {stub_source_path}")
-	stub_cs.write_text(stub_source_path.read_text(encoding="utf-8"), encoding="utf-8")
+	stub_source = stub_source_path.read_bytes()
 
-	cmd = [
-		str(csc_path),
+	options = [
 		"/nologo",
 		"/target:exe",
 		"/platform:anycpu",
-		f"/out:{stub_exe}",
 		"/optimize+",
+		# No debug info: keeps the stub small and stops csc emitting a PDB.
+		"/debug-",
+		"/nowarn:1701,1702",
 		"/r:System.IO.Compression.FileSystem.dll",
 	]
-	if win_icon:
-		cmd.append(f"/win32icon:{win_icon}")
-	cmd.append(str(stub_cs))
-
-	log(f"Compiling stub with {csc_path}", verbose=verbose)
-	result = subprocess.run(cmd, capture_output=not verbose, text=True)
-	if result.returncode != 0:
-		raise BuildError(f"csc.exe failed: {result.stdout}\n{result.stderr}")
+
+	# The stub only depends on its source, the compiler, the options and the icon.
+	def cached_path(compiler: str) -> Path:
+		key = hashlib.sha256()
+		key.update(stub_source)
+		key.update(compiler.encode("utf-8"))
+		key.update("\0".join(options).encode("utf-8"))
+		if win_icon:
+			key.update(win_icon.read_bytes())
+		return stub_cache_dir() / f"{key.hexdigest()}.exe"
+
+	csc_identity = f"csc {csc_path}"
+	roslyn = load_roslyn() if in_process else None
+	compiler = f"roslyn {roslyn[3]}" if roslyn else csc_identity
+	cached_stub = cached_path(compiler)
+	if use_cache and cached_stub.is_file():
+		log(f"Using cached stub {cached_stub}", verbose=verbose)
+		shutil.copy2(cached_stub, stub_exe)
+		return stub_exe
+
+	if not (in_process and compile_stub_in_process(stub_source, stub_exe, verbose=verbose, win_icon=win_icon)):
+		if compiler != csc_identity:
+			# Roslyn fell back to csc.exe; file the result under csc.exe's key.
+			cached_stub = cached_path(csc_identity)
+		stub_cs.write_bytes(stub_source)
+		cmd = [str(csc_path), *options, f"/out:{stub_exe}"]
+		if win_icon:
+			cmd.append(f"/win32icon:{win_icon}")
+		cmd.append(str(stub_cs))
+
+		log(f"Compiling stub with {csc_path}", verbose=verbose)
+		result = subprocess.run(cmd, capture_output=not verbose, text=True)
+		if result.returncode != 0:
+			raise BuildError(f"csc.exe failed: {result.stdout}\n{result.stderr}")
+		stub_exe.with_suffix(".pdb").unlink(missing_ok=True)
+	if use_cache:
+		store_in_stub_cache(stub_exe, cached_stub, verbose=verbose)
 	return stub_exe
 
 
-def convert_image_to_ico(icon_path: Path, tmp_dir: Path, *, verbose: bool) -> Path:
-	icon_path = icon_path.expanduser().resolve()
-	if not icon_path.exists():
-		raise BuildError(f"Icon file not found: {icon_path}")
-	if icon_path.suffix.lower() == ".ico":
-		return icon_path
-
+def find_ico_converter(tmp_dir: Path, *, verbose: bool, use_cache: bool = True) -> Path:
+	"""Return the image->ICO converter, compiling gen_ico.cs only when no cached copy exists."""
 	csc_path = find_csc()
 	if not csc_path:
 		raise BuildError("Could not find csc.exe to compile the image-to-ico converter.")
 
-	converter_cs = tmp_dir / "gen_ico.cs"
 	converter_exe = tmp_dir / "gen_ico.exe"
-	out_ico = tmp_dir / "icon.ico"
-
 	source_path = Path(__file__).parent / "gen_ico.cs"
 	if not source_path.exists():
 		raise BuildError(f"Image converter source not found: {source_path}")
 
-	cmd = [
-		str(csc_path),
+	options = [
 		"/nologo",
 		"/target:exe",
-		f"/out:{converter_exe}",
 		"/optimize+",
 		"/r:System.Drawing.dll",
-		str(source_path),
 	]
+
+	key = hashlib.sha256()
+	key.update(source_path.read_bytes())
+	key.update(str(csc_path).encode("utf-8"))
+	key.update("\0".join(options).encode("utf-8"))
+	cached_converter = stub_cache_dir() / f"gen_ico-{key.hexdigest()}.exe"
+	if use_cache and cached_converter.is_file():
+		log(f"Using cached image->ICO converter {cached_converter}", verbose=verbose)
+		return cached_converter
+
+	cmd = [str(csc_path), *options, f"/out:{converter_exe}", str(source_path)]
 	log(f"Compiling image->ICO converter with {csc_path}", verbose=verbose)
 	res = subprocess.run(cmd, capture_output=not verbose, text=True)
 	if res.returncode != 0:
 		raise BuildError(f"Failed to compile image converter: {res.stdout}\n{res.stderr}")
+	if use_cache:
+		store_in_stub_cache(converter_exe, cached_converter, verbose=verbose)
+	return converter_exe
+
+
+def convert_with_pillow(image_bytes: bytes, out_ico: Path) -> None:
+	# Frame the image like gen_ico.cs (centred on a transparent square, scaled
+	# up if needed since Pillow skips icon sizes larger than the source). Unlike
+	# gen_ico, Pillow stores every frame as PNG, including the small ones.
+	with Image.open(io.BytesIO(image_bytes)) as src:
+		src = src.convert("RGBA")
+		side = max(src.size)
+		canvas = Image.new("RGBA", (side, side), (0, 0, 0, 0))
+		canvas.paste(src, ((side - src.width) // 2, (side - src.height) // 2))
+	if side < ICO_SIZES[0]:
+		canvas = canvas.resize((ICO_SIZES[0], ICO_SIZES[0]), Image.LANCZOS)
+	canvas.save(out_ico, format="ICO", sizes=[(size, size) for size in ICO_SIZES])
+
+
+def convert_image_to_ico(icon_path: Path, tmp_dir: Path, *, verbose: bool, use_cache: bool = True) -> Path:
+	icon_path = icon_path.expanduser().resolve()
+	if not icon_path.exists():
+		raise BuildError(f"Icon file not found: {icon_path}")
+	if icon_path.suffix.lower() == ".ico":
+		return icon_path
 
-	# Run the converter
-	run = subprocess.run([str(converter_exe), str(icon_path), str(out_ico)], capture_output=not verbose, text=True)
+	out_ico = tmp_dir / "icon.ico"
+	image_bytes = icon_path.read_bytes()
+
+	if Image is not None:
+		try:
+			convert_with_pillow(image_bytes, out_ico)
+		except (OSError, ValueError, Image.DecompressionBombError) as exc:
+			raise BuildError(f"Could not convert {icon_path} to ICO: {exc}") from exc
+		log(f"Converted {icon_path} -> {out_ico} with Pillow", verbose=verbose)
+		return out_ico
+
+	converter_exe = find_ico_converter(tmp_dir, verbose=verbose, use_cache=use_cache)
+
+	# Run the converter, piping the image in on stdin ('-')
+	run = subprocess.run([str(converter_exe), "-", str(out_ico)], input=image_bytes, capture_output=not verbose)
 	if run.returncode != 0:
-		raise BuildError(f"Image converter failed: {run.stdout}\n{run.stderr}")
+		stdout = (run.stdout or b"").decode(errors="replace")
+		stderr = (run.stderr or b"").decode(errors="replace")
+		raise BuildError(f"Image converter failed: {stdout}\n{stderr}")
 	if not out_ico.exists():
 		raise BuildError("Image converter did not produce an ICO file.")
 	log(f"Converted {icon_path} -> {out_ico}", verbose=verbose)
 	return out_ico
 
 
+def sha256_file(path: Path) -> bytes:
+	with path.open("rb") as f:
+		if hasattr(hashlib, "file_digest"):
+			return hashlib.file_digest(f, "sha256").digest()
+		# Python < 3.11
+		sha256 = hashlib.sha256()
+		while chunk := f.read(COPY_CHUNK_SIZE):
+			sha256.update(chunk)
+		return sha256.digest()
+
+
+def write_mapped(src_path: Path, out: BinaryIO) -> int:
+	"""Append *src_path* to *out* through a read-only memory map; returns bytes written."""
+	with src_path.open("rb") as src:
+		size = os.fstat(src.fileno()).st_size
+		if size == 0:
+			# Empty files cannot be mapped.
+			return 0
+		with mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+			out.write(mm)
+	return size
+
+
+def preallocate(out: BinaryIO, size: int) -> None:
+	# Best-effort: reserve disk space for *out* without writing anything or
+	# changing its length (truncate() would zero-fill the whole file on Windows).
+	if sys.platform != "win32":
+		return
+	try:
+		import ctypes
+		import msvcrt
+		from ctypes import wintypes
+
+		FileAllocationInfo = 5
+
+		class FILE_ALLOCATION_INFO(ctypes.Structure):
+			_fields_ = [("AllocationSize", ctypes.c_longlong)]
+
+		kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+		kernel32.SetFileInformationByHandle.restype = wintypes.BOOL
+		kernel32.SetFileInformationByHandle.argtypes = [
+			wintypes.HANDLE, ctypes.c_int, wintypes.LPVOID, wintypes.DWORD,
+		]
+		info = FILE_ALLOCATION_INFO(size)
+		kernel32.SetFileInformationByHandle(
+			msvcrt.get_osfhandle(out.fileno()), FileAllocationInfo, ctypes.byref(info), ctypes.sizeof(info)
+		)
+	except (AttributeError, OSError, ValueError):
+		pass
+
+
 def assemble_exe(stub_path: Path, payload_zip: Path, output_path: Path) -> None:
-	payload_bytes = payload_zip.read_bytes()
-	payload_len = len(payload_bytes)
-	sha256_digest = hashlib.sha256(payload_bytes).digest()
+	# The payload was just written, so hashing it up front is served from the
+	# OS cache and the copy below maps the same pages.
+	sha256_digest = sha256_file(payload_zip)
 
 	# Ensure parent directory exists
 	output_path.parent.mkdir(parents=True, exist_ok=True)
@@ -302,15 +981,118 @@ def assemble_exe(stub_path: Path, payload_zip: Path, output_path: Path) -> None:
 	if output_path.exists():
 		output_path.unlink()
 	
-	# Write directly to the output path with explicit truncation mode
-	with stub_path.open("rb") as stub_file, output_path.open("wb") as out:
-		shutil.copyfileobj(stub_file, out)
-		out.write(payload_bytes)
+	# Write directly to the output path with explicit truncation mode. The
+	# final size is known up front, so reserve it in one step rather than
+	# letting the file grow (and fragment) write by write.
+	total_len = stub_path.stat().st_size + payload_zip.stat().st_size + FOOTER_LEN
+	with output_path.open("wb") as out:
+		preallocate(out, total_len)
+		write_mapped(stub_path, out)
+		payload_len = write_mapped(payload_zip, out)
 		out.write(struct.pack("<Q", payload_len))
 		out.write(sha256_digest)
 		out.write(MARKER)
 
 
+def volume_is_fast(path: str | Path) -> bool:
+	"""Return True if *path* is on a local RAM disk or a fixed drive without a seek penalty (SSD/NVMe)."""
+	drive = os.path.splitdrive(os.path.abspath(path))[0]
+	if not drive or drive.startswith(("\\\\", "//")):
+		# No drive letter (non-Windows) or a network share.
+		return False
+	try:
+		import ctypes
+		from ctypes import wintypes
+
+		DRIVE_FIXED = 3
+		DRIVE_RAMDISK = 6
+		FILE_SHARE_READ = 0x1
+		FILE_SHARE_WRITE = 0x2
+		OPEN_EXISTING = 3
+		IOCTL_STORAGE_QUERY_PROPERTY = 0x2D1400
+		StorageDeviceSeekPenaltyProperty = 7
+		PropertyStandardQuery = 0
+
+		class STORAGE_PROPERTY_QUERY(ctypes.Structure):
+			_fields_ = [
+				("PropertyId", wintypes.DWORD),
+				("QueryType", wintypes.DWORD),
+				("AdditionalParameters", ctypes.c_ubyte * 1),
+			]
+
+		class DEVICE_SEEK_PENALTY_DESCRIPTOR(ctypes.Structure):
+			_fields_ = [
+				("Version", wintypes.DWORD),
+				("Size", wintypes.DWORD),
+				("IncursSeekPenalty", wintypes.BOOLEAN),
+			]
+
+		kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+		kernel32.CreateFileW.restype = wintypes.HANDLE
+		kernel32.CreateFileW.argtypes = [
+			wintypes.LPCWSTR, wintypes.DWORD, wintypes.DWORD, wintypes.LPVOID,
+			wintypes.DWORD, wintypes.DWORD, wintypes.HANDLE,
+		]
+		kernel32.DeviceIoControl.restype = wintypes.BOOL
+		kernel32.DeviceIoControl.argtypes = [
+			wintypes.HANDLE, wintypes.DWORD, wintypes.LPVOID, wintypes.DWORD,
+			wintypes.LPVOID, wintypes.DWORD, ctypes.POINTER(wintypes.DWORD), wintypes.LPVOID,
+		]
+		kernel32.CloseHandle.restype = wintypes.BOOL
+		kernel32.CloseHandle.argtypes = [wintypes.HANDLE]
+
+		drive_type = kernel32.GetDriveTypeW(drive + "\\")
+		if drive_type == DRIVE_RAMDISK:
+			return True
+		if drive_type != DRIVE_FIXED:
+			return False
+
+		# Opening the volume with no access rights is enough for this query
+		# and does not require elevation.
+		handle = kernel32.CreateFileW(
+			f"\\\\.\\{drive}", 0, FILE_SHARE_READ | FILE_SHARE_WRITE, None, OPEN_EXISTING, 0, None
+		)
+		if handle == wintypes.HANDLE(-1).value:
+			return False
+		try:
+			query = STORAGE_PROPERTY_QUERY(StorageDeviceSeekPenaltyProperty, PropertyStandardQuery)
+			descriptor = DEVICE_SEEK_PENALTY_DESCRIPTOR()
+			returned = wintypes.DWORD()
+			ok = kernel32.DeviceIoControl(
+				handle,
+				IOCTL_STORAGE_QUERY_PROPERTY,
+				ctypes.byref(query),
+				ctypes.sizeof(query),
+				ctypes.byref(descriptor),
+				ctypes.sizeof(descriptor),
+				ctypes.byref(returned),
+				None,
+			)
+		finally:
+			kernel32.CloseHandle(handle)
+		return bool(ok) and not descriptor.IncursSeekPenalty
+	except (AttributeError, OSError, ValueError):
+		return False
+
+
+def choose_temp_dir(output_dir: Path, *, verbose: bool) -> str | None:
+	"""Pick a parent directory for the build's temp files, or None for the system default."""
+	# PREFIX_FREEZER_TMPDIR wins if it exists. Otherwise take the first of the output
+	# directory (keeps the final writes on one volume), RUNNER_TEMP and the system
+	# temp directory that sits on a fast local drive.
+	override = os.environ.get("PREFIX_FREEZER_TMPDIR")
+	if override:
+		if os.path.isdir(override):
+			log(f"Using temp directory from PREFIX_FREEZER_TMPDIR: {override}", verbose=verbose)
+			return override
+		log(f"Ignoring PREFIX_FREEZER_TMPDIR, not a directory: {override}", verbose=True)
+	for candidate in (str(output_dir), os.environ.get("RUNNER_TEMP"), tempfile.gettempdir()):
+		if candidate and os.path.isdir(candidate) and volume_is_fast(candidate):
+			log(f"Using temp directory on fast drive: {candidate}", verbose=verbose)
+			return candidate
+	return None
+
+
 def build(argv: list[str]) -> None:
 	args = parse_args(argv)
 	ensure_windows()
@@ -334,16 +1116,20 @@ def build(argv: list[str]) -> None:
 	if not main_file.exists() or not main_file.is_file():
 		raise BuildError(f"Main script not found: {main_file}")
 
-	with tempfile.TemporaryDirectory() as tmpdir_str:
+	with tempfile.TemporaryDirectory(dir=choose_temp_dir(output_path.parent, verbose=args.verbose)) as tmpdir_str:
 		tmpdir = Path(tmpdir_str)
-		payload_root = tmpdir / "payload"
-		payload_root.mkdir(parents=True, exist_ok=True)
-
-		log("Copying prefix runtime...", verbose=args.verbose)
-		copy_pre_runtime(pre_exe, payload_root, verbose=args.verbose, exclude={output_path})
-
-		log("Copying main script...", verbose=args.verbose)
-		main_rel_path = copy_main(main_file, main_dest_rel, payload_root)
+		# Case-folded bundle path -> (bundle path, source file). Later additions
+		# replace earlier ones at the same path, so includes can override
+		# runtime files.
+		entries: dict[str, tuple[str, str | Path]] = {}
+		# Raw include path -> resolved path, shared by --include and --include-folder.
+		resolved: dict[str, Path] = {}
+
+		log("Collecting prefix runtime...", verbose=args.verbose)
+		# The temp directory may sit inside the runtime folder when it shares the output directory.
+		add_pre_runtime(pre_exe, entries, verbose=args.verbose, exclude={output_path, tmpdir.resolve()})
+
+		main_rel_path = add_main(main_file, main_dest_rel, entries)
 		log(f"Main placed at {main_rel_path}", verbose=args.verbose)
 
 		# Ensure an extension pointer file (.prex) is present in the bundle so
@@ -352,6 +1138,10 @@ def build(argv: list[str]) -> None:
 		# Prefer an existing pointer file next to the original main file, or
 		# the program-specific .prex (e.g. program.prex). Otherwise generate
 		# one that points into the bundled `ext/` folder.
+		# The pointer goes next to the bundled main script so that runtime
+		# lookup (prog dir / basename .prex) resolves correctly.
+		prex_name = archive_name(main_dest_rel, ".prex")
+		generated_prex: str | None = None
 		try:
 			pointer_candidates = [
 				main_file.parent / ".prex",
@@ -360,58 +1150,80 @@ def build(argv: list[str]) -> None:
 			pointer_copied = False
 			for pc in pointer_candidates:
 				if pc.exists():
-					# Copy the pointer file next to the bundled main script so that
-					# runtime lookup (prog dir / basename .prex) resolves correctly.
-					dest_for_prex = payload_root if main_dest_rel == "." else payload_root / main_dest_rel
-					dest_for_prex.mkdir(parents=True, exist_ok=True)
-					shutil.copy2(pc, dest_for_prex / ".prex")
-					log(f"Copied pointer file {pc} -> {dest_for_prex / '.prex'}", verbose=args.verbose)
+					add_entry(entries, prex_name, pc)
+					log(f"Bundling pointer file {pc} -> {prex_name}", verbose=args.verbose)
 					pointer_copied = True
 					break
 			if not pointer_copied:
-				# Auto-generate .prex listing all .py files in payload_root/ext
-				ext_dir = payload_root / "ext"
-				if ext_dir.exists() and ext_dir.is_dir():
-					lines: list[str] = []
-					for f in sorted(ext_dir.iterdir()):
-						if f.is_file() and f.suffix == ".py":
-							# Reference the file relative to the bundle root so the
-							# interpreter will resolve it directly after extraction.
-							lines.append(str(Path("ext") / f.name))
-					if lines:
-						dest_for_prex = payload_root if main_dest_rel == "." else payload_root / main_dest_rel
-						dest_for_prex.mkdir(parents=True, exist_ok=True)
-						(dest_for_prex / ".prex").write_text("\n".join(lines) + "\n", encoding="utf-8")
-						log(f"Generated .prex with {len(lines)} extensions -> {dest_for_prex / '.prex'}", verbose=args.verbose)
+				# Auto-generate .prex listing all .py files in the runtime's ext/
+				# (a missing ext/ is handled by the OSError fallback below).
+				with os.scandir(pre_exe.parent / "ext") as it:
+					# Reference the file relative to the bundle root so the
+					# interpreter will resolve it directly after extraction.
+					lines = sorted(
+						os.path.join("ext", entry.name)
+						for entry in it
+						if entry.name.endswith(".py") and entry.is_file()
+					)
+				if lines:
+					generated_prex = "\n".join(lines) + "\n"
+					log(f"Generated .prex with {len(lines)} extensions -> {prex_name}", verbose=args.verbose)
 		except OSError:
 			# Best-effort only; failure to copy/generate a pointer should not
 			# abort the build. The runtime will continue without extensions.
 			pass
 
 		if args.include:
-			log("Copying additional files...", verbose=args.verbose)
-			copy_includes(args.include, payload_root, verbose=args.verbose)
+			log("Collecting additional files...", verbose=args.verbose)
+			add_includes(args.include, entries, resolved, verbose=args.verbose)
 
 		if args.include_folder:
-			log("Copying additional folders...", verbose=args.verbose)
-			copy_include_folders(args.include_folder, payload_root, verbose=args.verbose)
+			log("Collecting additional folders...", verbose=args.verbose)
+			add_include_folders(args.include_folder, entries, resolved, verbose=args.verbose)
 
-		write_manifest(payload_root, main_rel_path)
+		# Generated files go straight into the zip. An included .prex at the
+		# same path replaces the generated one, and the manifest always wins.
+		extras: list[tuple[str, bytes]] = []
+		if generated_prex is not None and os.path.normcase(prex_name) not in entries:
+			extras.append((prex_name, generated_prex.encode("utf-8")))
+		entries.pop(os.path.normcase(MANIFEST_NAME), None)
+		extras.append((MANIFEST_NAME, (main_rel_path + "\n").encode("ascii")))
 
 		payload_zip = tmpdir / "payload.zip"
-		build_payload_zip(payload_root, payload_zip)
+		if args.compression_level > zlib.Z_BEST_COMPRESSION and libdeflate is None:
+			log(
+				f"Compression level {args.compression_level} needs the 'deflate' package; using {zlib.Z_BEST_COMPRESSION}",
+				verbose=True,
+			)
+		build_payload_zip(
+			[(src, arcname) for arcname, src in entries.values()],
+			payload_zip,
+			extra_entries=extras,
+			level=args.compression_level,
+			verbose=args.verbose,
+		)
 
 		# If an icon was provided, convert it to ICO (if needed) and compile the stub with it.
 		ico_for_build = None
 		if args.icon:
-			ico_for_build = convert_image_to_ico(Path(args.icon), tmpdir, verbose=args.verbose)
-		stub_exe = compile_stub(tmpdir, verbose=args.verbose, win_icon=ico_for_build)
+			ico_for_build = convert_image_to_ico(
+				Path(args.icon), tmpdir, verbose=args.verbose, use_cache=not args.no_stub_cache
+			)
+		stub_exe = compile_stub(
+			tmpdir,
+			verbose=args.verbose,
+			win_icon=ico_for_build,
+			use_cache=not args.no_stub_cache,
+			in_process=args.in_process_csc,
+		)
 		assemble_exe(stub_exe, payload_zip, output_path)
 
 		log(f"Built self-extracting EXE: {output_path}", verbose=True)
 
 
 if __name__ == "__main__":
+	# Lets compression workers start correctly from a frozen freezer.exe.
+	multiprocessing.freeze_support()
 	try:
 		build(sys.argv[1:])
 	except BuildError as exc:
@@ -7,14 +7,27 @@ using System.Collections.Generic;
 
 class ImgToIco
 {
+    // "-" reads the image from stdin.
+    static Image LoadImage(string path)
+    {
+        if (path != "-")
+            return Image.FromFile(path);
+        // Image.FromStream needs a seekable stream that stays open while the image is in use.
+        var ms = new MemoryStream();
+        using (Stream stdin = Console.OpenStandardInput())
+            stdin.CopyTo(ms);
+        ms.Position = 0;
+        return Image.FromStream(ms);
+    }
+
     static int Main(string[] args)
     {
-        if (args.Length != 2) { Console.Error.WriteLine("Usage: img2ico <in> <out>"); return 2; }
+        if (args.Length != 2) { Console.Error.WriteLine("Usage: img2ico <in|-> <out>"); return 2; }
         string inPath = args[0];
         string outPath = args[1];
         try
         {
-            using (Image src = Image.FromFile(inPath))
+            using (Image src = LoadImage(inPath))
             {
                 int[] sizes = new int[] {256,128,64,48,32,16};
                 var images = new List<byte[]>();